@@ -4,12 +4,15 @@ from pydantic import BaseModel
 from typing import Optional, List
 import os
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from contextlib import contextmanager
+from collections import deque
 import httpx
 import asyncio
+import json
 import traceback
 import logging
+from single_flight import SingleFlight, normalize_text
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -43,6 +46,18 @@ SERVICES = {
     "keywords": "http://keywords:8005"
 }
 
+# Persistencia write-behind (opcional): los resultados se encolan en memoria y
+# un task en segundo plano los inserta por lotes
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_CONFIG = {
+    "max_queue": int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "1000")),
+    "batch_size": int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100")),
+    "flush_interval": float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0")),
+    "enqueue_timeout": float(os.getenv("WRITE_BEHIND_ENQUEUE_TIMEOUT", "5.0")),
+    "drain_timeout": float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT", "10.0")),
+    "spill_path": os.getenv("WRITE_BEHIND_SPILL_PATH", "/var/lib/backend/write-behind.jsonl"),
+}
+
 @contextmanager
 def get_db_connection():
     conn = psycopg2.connect(**DB_CONFIG)
@@ -55,13 +70,267 @@ def get_db_connection():
     finally:
         conn.close()
 
+def insert_text_requests(rows, page_size=100):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO text_requests (original_text, processed_text, service_used, status, metadata)
+                VALUES %s
+            """, rows, page_size=page_size)
+
+# Errores de los datos de una fila: reintentar el mismo lote no sirve
+# (p. ej. psycopg2 lanza ValueError si el texto contiene NUL)
+ROW_DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, ValueError)
+
+def read_spill_file(path):
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                rows.append(tuple(json.loads(line)))
+            except ValueError:
+                # Línea truncada por un crash a mitad de escritura
+                logger.warning(f"Skipping corrupt line in spill file {path}")
+    return rows
+
+def write_spill_file(path, rows):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class WriteBehindBuffer:
+    # Cola acotada de filas pendientes de insertar. Cada fila encolada se añade
+    # también a un fichero de spill; al empezar un flush el fichero se rota a
+    # <spill_path>.flushing y se borra cuando el INSERT hace commit. Tras un
+    # crash, ambos ficheros se reinsertan al arrancar (entrega at-least-once).
+    # Los errores de conexión se reintentan con el mismo lote; si el lote falla
+    # por sus datos se divide hasta aislar las filas culpables, que se mueven a
+    # <spill_path>.dead para que el resto se guarde.
+    # Todo el I/O de disco corre en hilos (asyncio.to_thread) para no bloquear
+    # el event loop. Durabilidad: cada línea se escribe con flush() y el
+    # fichero recibe fsync al rotar, es decir como tarde cada flush_interval. Un crash del proceso
+    # no pierde filas; un fallo del nodo puede perder las del último intervalo.
+    # Las filas solo sobreviven a la pérdida del pod si spill_path está en un
+    # volumen persistente (con emptyDir solo sobreviven a reinicios del
+    # contenedor dentro del mismo pod).
+
+    def __init__(self, max_queue, batch_size, flush_interval, enqueue_timeout, drain_timeout, spill_path):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.drain_timeout = drain_timeout
+        self.spill_path = spill_path
+        self.flushing_path = spill_path + ".flushing"
+        self.dead_letter_path = spill_path + ".dead"
+        self._pending = deque()
+        self._inflight = []
+        self._journal = None
+        self._not_full = None
+        self._wake = None
+        self._task = None
+        self._closing = False
+        self.queued_rows = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rejected_rows = 0
+        self.dead_lettered_rows = 0
+
+    async def start(self):
+        self._not_full = asyncio.Condition()
+        self._wake = asyncio.Event()
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        self._recover()
+        self._journal = open(self.spill_path, "a", encoding="utf-8")
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._on_task_done)
+        logger.info(f"Write-behind enabled - batch size: {self.batch_size}, max queue: {self.max_queue}")
+
+    def _recover(self):
+        rows = read_spill_file(self.flushing_path) + read_spill_file(self.spill_path)
+        if rows:
+            write_spill_file(self.flushing_path, rows)
+            logger.warning(f"Recovered {len(rows)} unsaved results from {self.spill_path}")
+        elif os.path.exists(self.flushing_path):
+            os.remove(self.flushing_path)
+        open(self.spill_path, "w").close()
+        self._inflight = rows
+
+    def _on_task_done(self, task):
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error(f"Write-behind flusher died, falling back to synchronous inserts: {str(exc)}")
+        elif not self._closing:
+            logger.error("Write-behind flusher exited unexpectedly, falling back to synchronous inserts")
+
+    async def enqueue(self, row):
+        # Devuelve False si la cola sigue llena tras enqueue_timeout (backpressure),
+        # si se está cerrando o si el flusher ha muerto; el llamador debe entonces
+        # insertar en síncrono
+        if self._closing or self._task.done():
+            return False
+        async with self._not_full:
+            try:
+                await asyncio.wait_for(
+                    self._not_full.wait_for(
+                        lambda: len(self._pending) < self.max_queue or self._task.done()
+                    ),
+                    timeout=self.enqueue_timeout
+                )
+            except asyncio.TimeoutError:
+                self.rejected_rows += 1
+                logger.warning("Write-behind queue full, falling back to synchronous insert")
+                return False
+            if self._task.done():
+                return False
+            try:
+                # Con el lock tomado para que _rotate no separe la línea de su fila
+                await asyncio.to_thread(self._append_journal, json.dumps(row) + "\n")
+            except (OSError, ValueError) as e:
+                self.rejected_rows += 1
+                logger.error(f"Write-behind spill write failed, falling back to synchronous insert: {str(e)}")
+                return False
+            self._pending.append(row)
+            self.queued_rows += 1
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def _append_journal(self, line):
+        self._journal.write(line)
+        self._journal.flush()
+
+    def _open_journal(self):
+        return open(self.spill_path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _sync_and_close(journal):
+        try:
+            os.fsync(journal.fileno())
+        finally:
+            journal.close()
+
+    async def _rotate(self):
+        # El lock solo cubre el rename y el cambio de deque; el fsync del
+        # fichero rotado se hace después, sin bloquear los enqueue
+        async with self._not_full:
+            if self._journal.closed:
+                self._journal = await asyncio.to_thread(self._open_journal)
+            old_journal = self._journal
+            await asyncio.to_thread(os.replace, self.spill_path, self.flushing_path)
+            self._inflight = list(self._pending)
+            self._pending.clear()
+            self._not_full.notify_all()
+            try:
+                self._journal = await asyncio.to_thread(self._open_journal)
+            except OSError:
+                # Los enqueue caen al insert síncrono hasta el siguiente _rotate
+                old_journal.close()
+                raise
+        await asyncio.to_thread(self._sync_and_close, old_journal)
+
+    async def _insert_inflight(self):
+        # Las filas se quitan de _inflight según hacen commit, así un reintento
+        # tras un error de conexión no las duplica. sizes es una pila con los
+        # tamaños de los trozos pendientes, desde la cabeza de _inflight.
+        sizes = [len(self._inflight)]
+        while sizes:
+            size = sizes.pop()
+            rows = self._inflight[:size]
+            try:
+                await asyncio.to_thread(insert_text_requests, rows, self.batch_size)
+                self.flushed_rows += size
+            except ROW_DATA_ERRORS as e:
+                if size > 1:
+                    half = size // 2
+                    sizes += [size - half, half]
+                    continue
+                await asyncio.to_thread(self._dead_letter, rows[0], e)
+            del self._inflight[:size]
+
+    def _dead_letter(self, row, error):
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"row": row, "error": str(error)}) + "\n")
+        self.dead_lettered_rows += 1
+        logger.error(f"Write-behind row rejected, moved to {self.dead_letter_path}: {str(error)}")
+
+    async def _run(self):
+        while not (self._closing and not self._pending and not self._inflight):
+            if not self._inflight and len(self._pending) < self.batch_size and not self._closing:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if not self._inflight and not self._pending:
+                continue
+            try:
+                if not self._inflight:
+                    await self._rotate()
+                await self._insert_inflight()
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Write-behind flush of {len(self._inflight) or len(self._pending)} rows failed: {str(e)}")
+                if self._closing:
+                    # Las filas quedan en disco y se reinsertan al arrancar
+                    return
+                await asyncio.sleep(self.flush_interval)
+                continue
+            self.flushes += 1
+            try:
+                await asyncio.to_thread(os.remove, self.flushing_path)
+            except OSError as e:
+                # Las filas ya están en la BD: no se reintenta el INSERT, el
+                # siguiente _rotate sobrescribe el fichero
+                logger.error(f"Could not remove {self.flushing_path}: {str(e)}")
+
+    async def close(self):
+        self._closing = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Write-behind drain timed out, unsaved results kept in {self.spill_path}")
+        except Exception:
+            # Ya registrado en _on_task_done; las filas quedan en disco
+            pass
+        self._journal.close()
+        logger.info(f"Write-behind drained - flushed rows: {self.flushed_rows}")
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "inflight": len(self._inflight),
+            "queued_rows": self.queued_rows,
+            "flushed_rows": self.flushed_rows,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "rejected_rows": self.rejected_rows,
+            "dead_lettered_rows": self.dead_lettered_rows
+        }
+
+write_behind = WriteBehindBuffer(**WRITE_BEHIND_CONFIG) if WRITE_BEHIND_ENABLED else None
+
+single_flight = SingleFlight()
+
 class TextRequest(BaseModel):
     text: str
     service: str
     options: Optional[dict] = {}
 
 class TextResponse(BaseModel):
-    id: int
+    id: Optional[int] = None
     original_text: str
     processed_text: str
     service_used: str
@@ -97,6 +366,14 @@ async def startup_event():
                 CREATE INDEX IF NOT EXISTS idx_created_at 
                 ON text_requests(created_at DESC)
             """)
+    
+    if write_behind:
+        await write_behind.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if write_behind:
+        await write_behind.close()
 
 @app.get("/")
 async def root():
@@ -140,6 +417,94 @@ async def health_check():
         "microservices": microservices_status
     }
 
+async def call_service(service: str, text: str, options: dict):
+    service_url = SERVICES[service]
+    logger.info(f"Calling service at: {service_url}")
+
+    processed_text = ""
+    metadata = ""
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        if service == "translate":
+            target_lang = options.get("target_language", "es")
+            logger.info(f"Translating to: {target_lang}")
+
+            response = await client.post(
+                f"{service_url}/translate",
+                json={"text": text, "target_language": target_lang}
+            )
+            logger.info(f"Translation service responded with status: {response.status_code}")
+
+            if response.status_code == 200:
+                data = response.json()
+                processed_text = data.get("translated_text", "")
+                metadata = str(data)
+            else:
+                error_text = response.text
+                logger.error(f"Translation service error: {error_text}")
+                raise HTTPException(status_code=response.status_code, detail=f"Translation service error: {error_text}")
+
+        elif service == "summary":
+            max_length = options.get("max_length", 100)
+            response = await client.post(
+                f"{service_url}/summarize",
+                json={"text": text, "max_length": max_length}
+            )
+            if response.status_code == 200:
+                data = response.json()
+                processed_text = data.get("summary", "")
+                metadata = str(data)
+            else:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+
+        elif service == "analytics":
+            response = await client.post(
+                f"{service_url}/analyze",
+                json={"text": text}
+            )
+            if response.status_code == 200:
+                data = response.json()
+                processed_text = f"Sentiment: {data.get('sentiment', 'N/A')}\n"
+                processed_text += f"Entities: {', '.join(data.get('entities', []))}\n"
+                processed_text += f"Topics: {', '.join(data.get('topics', []))}\n"
+                processed_text += f"Complexity: {data.get('complexity', 'N/A')}\n"
+                processed_text += f"Word count: {data.get('word_count', 0)}"
+                metadata = str(data)
+            else:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+
+        elif service == "improve":
+            style = options.get("style", "professional")
+            response = await client.post(
+                f"{service_url}/improve",
+                json={"text": text, "style": style}
+            )
+            if response.status_code == 200:
+                data = response.json()
+                processed_text = data.get("improved_text", "")
+                metadata = str(data)
+            else:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+
+        elif service == "keywords":
+            max_keywords = options.get("max_keywords", 10)
+            response = await client.post(
+                f"{service_url}/extract",
+                json={"text": text, "max_keywords": max_keywords}
+            )
+            if response.status_code == 200:
+                data = response.json()
+                keywords = data.get("keywords", [])
+                processed_text = "Keywords: " + ", ".join(keywords)
+                metadata = str(data)
+            else:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+
+        if not processed_text:
+            raise HTTPException(status_code=500, detail="Microservice returned empty response")
+    
+    return processed_text, metadata
+
 @app.post("/api/process", response_model=TextResponse)
 async def process_text(request: TextRequest):
     try:
@@ -151,90 +516,23 @@ async def process_text(request: TextRequest):
         if request.service not in SERVICES:
             raise HTTPException(status_code=400, detail=f"Invalid service. Available: {list(SERVICES.keys())}")
         
-        service_url = SERVICES[request.service]
-        logger.info(f"Calling service at: {service_url}")
+        text = normalize_text(request.text)
+        key = (request.service, text, json.dumps(request.options, sort_keys=True, default=str))
+        processed_text, metadata = await single_flight.do(
+            key, lambda: call_service(request.service, text, request.options)
+        )
         
-        processed_text = ""
-        metadata = ""
+        row = (request.text, processed_text, request.service, "completed", metadata)
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            if request.service == "translate":
-                target_lang = request.options.get("target_language", "es")
-                logger.info(f"Translating to: {target_lang}")
-                
-                response = await client.post(
-                    f"{service_url}/translate",
-                    json={"text": request.text, "target_language": target_lang}
-                )
-                logger.info(f"Translation service responded with status: {response.status_code}")
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    processed_text = data.get("translated_text", "")
-                    metadata = str(data)
-                else:
-                    error_text = response.text
-                    logger.error(f"Translation service error: {error_text}")
-                    raise HTTPException(status_code=response.status_code, detail=f"Translation service error: {error_text}")
-                    
-            elif request.service == "summary":
-                max_length = request.options.get("max_length", 100)
-                response = await client.post(
-                    f"{service_url}/summarize",
-                    json={"text": request.text, "max_length": max_length}
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    processed_text = data.get("summary", "")
-                    metadata = str(data)
-                else:
-                    raise HTTPException(status_code=response.status_code, detail=response.text)
-                    
-            elif request.service == "analytics":
-                response = await client.post(
-                    f"{service_url}/analyze",
-                    json={"text": request.text}
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    processed_text = f"Sentiment: {data.get('sentiment', 'N/A')}\n"
-                    processed_text += f"Entities: {', '.join(data.get('entities', []))}\n"
-                    processed_text += f"Topics: {', '.join(data.get('topics', []))}\n"
-                    processed_text += f"Complexity: {data.get('complexity', 'N/A')}\n"
-                    processed_text += f"Word count: {data.get('word_count', 0)}"
-                    metadata = str(data)
-                else:
-                    raise HTTPException(status_code=response.status_code, detail=response.text)
-                    
-            elif request.service == "improve":
-                style = request.options.get("style", "professional")
-                response = await client.post(
-                    f"{service_url}/improve",
-                    json={"text": request.text, "style": style}
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    processed_text = data.get("improved_text", "")
-                    metadata = str(data)
-                else:
-                    raise HTTPException(status_code=response.status_code, detail=response.text)
-                    
-            elif request.service == "keywords":
-                max_keywords = request.options.get("max_keywords", 10)
-                response = await client.post(
-                    f"{service_url}/extract",
-                    json={"text": request.text, "max_keywords": max_keywords}
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    keywords = data.get("keywords", [])
-                    processed_text = "Keywords: " + ", ".join(keywords)
-                    metadata = str(data)
-                else:
-                    raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            if not processed_text:
-                raise HTTPException(status_code=500, detail="Microservice returned empty response")
+        if write_behind and await write_behind.enqueue(row):
+            logger.info("Successfully processed text, queued for write-behind persistence")
+            return {
+                "id": None,
+                "original_text": request.text,
+                "processed_text": processed_text,
+                "service_used": request.service,
+                "status": "queued"
+            }
         
         logger.info("Successfully processed text, saving to database")
         
@@ -245,7 +543,7 @@ async def process_text(request: TextRequest):
                     INSERT INTO text_requests (original_text, processed_text, service_used, status, metadata)
                     VALUES (%s, %s, %s, %s, %s)
                     RETURNING id, original_text, processed_text, service_used, status
-                """, (request.text, processed_text, request.service, "completed", metadata))
+                """, row)
                 
                 result = cur.fetchone()
         
@@ -300,10 +598,15 @@ async def get_stats():
             cur.execute("SELECT COUNT(*) as total FROM text_requests")
             total = cur.fetchone()
     
-    return {
+    response = {
         "total_requests": total["total"],
-        "by_service": stats
+        "by_service": stats,
+        "single_flight": single_flight.stats()
     }
+    if write_behind:
+        response["write_behind"] = write_behind.stats()
+    
+    return response
 
 if __name__ == "__main__":
     import uvicorn
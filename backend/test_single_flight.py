@@ -0,0 +1,128 @@
+import asyncio
+import importlib.util
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared"))
+
+spec = importlib.util.spec_from_file_location("backend_main", Path(__file__).with_name("main.py"))
+main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(main)
+
+DUPLICATES = 100
+PAYLOAD = {"text": "Popular text", "service": "summary", "options": {"max_length": 50}}
+
+
+class FakeCursor:
+    def __init__(self):
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        self.row = params
+
+    def fetchone(self):
+        original_text, processed_text, service_used, status, _ = self.row
+        return {
+            "id": 1,
+            "original_text": original_text,
+            "processed_text": processed_text,
+            "service_used": service_used,
+            "status": status
+        }
+
+
+class FakeConnection:
+    def cursor(self, cursor_factory=None):
+        return FakeCursor()
+
+
+@contextmanager
+def fake_db_connection():
+    yield FakeConnection()
+
+
+@pytest.fixture(autouse=True)
+def gateway(monkeypatch):
+    monkeypatch.setattr(main, "get_db_connection", fake_db_connection)
+    monkeypatch.setattr(main, "write_behind", None)
+    monkeypatch.setattr(main, "single_flight", main.SingleFlight())
+
+
+async def post_duplicates():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+        return await asyncio.gather(
+            *[client.post("/api/process", json=PAYLOAD) for _ in range(DUPLICATES)]
+        )
+
+
+def test_duplicates_share_one_upstream_call(monkeypatch):
+    calls = []
+
+    async def stub_call_service(service, text, options):
+        calls.append((service, text, options))
+        await asyncio.sleep(0.05)
+        return "Short summary", "{}"
+
+    monkeypatch.setattr(main, "call_service", stub_call_service)
+
+    responses = asyncio.run(post_duplicates())
+
+    assert len(calls) == 1
+    assert [r.status_code for r in responses] == [200] * DUPLICATES
+    assert {r.json()["processed_text"] for r in responses} == {"Short summary"}
+    stats = main.single_flight.stats()
+    assert stats["upstream_calls"] == 1
+    assert stats["coalesced_calls"] == DUPLICATES - 1
+
+
+def test_duplicates_share_upstream_error(monkeypatch):
+    calls = []
+
+    async def stub_call_service(service, text, options):
+        calls.append((service, text, options))
+        await asyncio.sleep(0.05)
+        raise HTTPException(status_code=502, detail="Summary service error")
+
+    monkeypatch.setattr(main, "call_service", stub_call_service)
+
+    responses = asyncio.run(post_duplicates())
+
+    assert len(calls) == 1
+    assert [r.status_code for r in responses] == [502] * DUPLICATES
+
+
+def test_key_matches_text_sent_upstream(monkeypatch):
+    calls = []
+
+    async def stub_call_service(service, text, options):
+        calls.append(text)
+        await asyncio.sleep(0.05)
+        return "Short summary", "{}"
+
+    monkeypatch.setattr(main, "call_service", stub_call_service)
+
+    async def post_variants():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            return await asyncio.gather(*[
+                client.post("/api/process", json={**PAYLOAD, "text": text})
+                for text in ["Popular text", "  Popular text\r\n", "Popular  text"]
+            ])
+
+    responses = asyncio.run(post_variants())
+
+    assert [r.status_code for r in responses] == [200] * 3
+    assert sorted(calls) == ["Popular  text", "Popular text"]
+    assert main.single_flight.stats()["coalesced_calls"] == 1
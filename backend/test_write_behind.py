@@ -0,0 +1,159 @@
+import asyncio
+import importlib.util
+import sys
+import json
+import os
+import time
+from pathlib import Path
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared"))
+
+spec = importlib.util.spec_from_file_location("backend_main", Path(__file__).with_name("main.py"))
+main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(main)
+
+
+def make_row(text):
+    return (text, f"processed {text}", "summary", "completed", "{}")
+
+
+class StubDatabase:
+    def __init__(self):
+        self.rows = []
+        self.transient_failures = 0
+
+    def insert(self, rows, page_size=100):
+        if self.transient_failures:
+            self.transient_failures -= 1
+            raise psycopg2.OperationalError("could not connect to server")
+        if any("\x00" in row[0] for row in rows):
+            raise ValueError("A string literal cannot contain NUL (0x00) characters.")
+        self.rows.extend(rows)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    stub = StubDatabase()
+    monkeypatch.setattr(main, "insert_text_requests", stub.insert)
+    return stub
+
+
+@pytest.fixture
+def spill_path(tmp_path):
+    return str(tmp_path / "write-behind.jsonl")
+
+
+def make_buffer(spill_path, **overrides):
+    config = {
+        "max_queue": 100,
+        "batch_size": 10,
+        "flush_interval": 0.05,
+        "enqueue_timeout": 1.0,
+        "drain_timeout": 2.0,
+        "spill_path": spill_path
+    }
+    config.update(overrides)
+    return main.WriteBehindBuffer(**config)
+
+
+def test_recovers_spill_and_flushing_files_after_crash(db, spill_path):
+    main.write_spill_file(spill_path + ".flushing", [make_row("a"), make_row("b")])
+    with open(spill_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(make_row("c")) + "\n")
+        f.write('["truncated by the crash')
+
+    async def scenario():
+        buffer = make_buffer(spill_path)
+        await buffer.start()
+        await buffer.close()
+
+    asyncio.run(scenario())
+
+    assert db.rows == [make_row("a"), make_row("b"), make_row("c")]
+    assert not os.path.exists(spill_path + ".flushing")
+    assert os.path.getsize(spill_path) == 0
+
+
+def test_enqueue_returns_false_when_queue_is_full(db, spill_path):
+    async def scenario():
+        buffer = make_buffer(spill_path, max_queue=2, batch_size=100, flush_interval=60, enqueue_timeout=0.1)
+        await buffer.start()
+        accepted = [await buffer.enqueue(make_row(str(i))) for i in range(2)]
+        started = time.monotonic()
+        overflow = await buffer.enqueue(make_row("overflow"))
+        waited = time.monotonic() - started
+        await buffer.close()
+        return accepted, overflow, waited, buffer.stats()
+
+    accepted, overflow, waited, stats = asyncio.run(scenario())
+
+    assert accepted == [True, True]
+    assert overflow is False
+    assert waited >= 0.1
+    assert stats["rejected_rows"] == 1
+    assert db.rows == [make_row("0"), make_row("1")]
+
+
+def test_close_flushes_pending_rows(db, spill_path):
+    async def scenario():
+        buffer = make_buffer(spill_path, batch_size=100, flush_interval=60)
+        await buffer.start()
+        for i in range(5):
+            assert await buffer.enqueue(make_row(str(i)))
+        assert db.rows == []
+        await buffer.close()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert db.rows == [make_row(str(i)) for i in range(5)]
+    assert stats["pending"] == 0
+    assert stats["flushed_rows"] == 5
+    assert not os.path.exists(spill_path + ".flushing")
+    assert os.path.getsize(spill_path) == 0
+
+
+def test_poisoned_batch_does_not_block_later_rows(db, spill_path):
+    rows = [make_row("bad\x00" if i in (3, 7) else str(i)) for i in range(20)]
+
+    async def scenario():
+        buffer = make_buffer(spill_path)
+        await buffer.start()
+        for row in rows:
+            assert await buffer.enqueue(row)
+        await asyncio.sleep(0.2)
+        assert await buffer.enqueue(make_row("later"))
+        await buffer.close()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+
+    good_rows = [row for row in rows if "\x00" not in row[0]] + [make_row("later")]
+    assert sorted(db.rows) == sorted(good_rows)
+    assert stats["dead_lettered_rows"] == 2
+    with open(spill_path + ".dead", encoding="utf-8") as f:
+        dead = [json.loads(line) for line in f]
+    assert [tuple(entry["row"]) for entry in dead] == [rows[3], rows[7]]
+    assert not os.path.exists(spill_path + ".flushing")
+
+
+def test_connection_errors_are_retried(db, spill_path):
+    db.transient_failures = 3
+
+    async def scenario():
+        buffer = make_buffer(spill_path, flush_interval=0.01)
+        await buffer.start()
+        for i in range(3):
+            assert await buffer.enqueue(make_row(str(i)))
+        await asyncio.sleep(0.2)
+        await buffer.close()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert db.rows == [make_row(str(i)) for i in range(3)]
+    assert stats["failed_flushes"] == 3
+    assert stats["dead_lettered_rows"] == 0
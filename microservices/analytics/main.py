@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import google.generativeai as genai
+import asyncio
 import os
+from single_flight import SingleFlight, normalize_text
 
 app = FastAPI(title="Analytics Service", version="1.0.0")
 
@@ -15,6 +17,8 @@ try:
 except:
     model = genai.GenerativeModel('gemini-pro-latest')
 
+single_flight = SingleFlight()
+
 class AnalyticsRequest(BaseModel):
     text: str
 
@@ -35,9 +39,14 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats():
+    return {"single_flight": single_flight.stats()}
+
 @app.post("/analyze", response_model=AnalyticsResponse)
 async def analyze(request: AnalyticsRequest):
     try:
+        text = normalize_text(request.text)
         prompt = f"""Analyze the following text and provide:
 1. Sentiment (positive/negative/neutral)
 2. Main entities (people, places, organizations)
@@ -52,9 +61,10 @@ Respond in JSON format:
     "complexity": "..."
 }}
 
-Text: {request.text}"""
+Text: {text}"""
         
-        response = model.generate_content(prompt)
+        key = (text,)
+        response = await single_flight.do(key, lambda: asyncio.to_thread(model.generate_content, prompt))
         
         # Parse basic JSON from response
         import json
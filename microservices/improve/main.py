@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import google.generativeai as genai
+import asyncio
 import os
+from single_flight import SingleFlight, normalize_text
 
 app = FastAPI(title="Improve Service", version="1.0.0")
 
@@ -15,6 +17,8 @@ try:
 except:
     model = genai.GenerativeModel('gemini-pro-latest')
 
+single_flight = SingleFlight()
+
 class ImproveRequest(BaseModel):
     text: str
     style: str = "professional"  # professional, casual, academic
@@ -33,9 +37,14 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats():
+    return {"single_flight": single_flight.stats()}
+
 @app.post("/improve", response_model=ImproveResponse)
 async def improve(request: ImproveRequest):
     try:
+        text = normalize_text(request.text)
         prompt = f"""Improve the following text with a {request.style} style.
 Fix grammar, improve clarity, and enhance readability.
 Provide the improved version and 3 key suggestions.
@@ -49,9 +58,10 @@ SUGGESTIONS:
 2. [suggestion 2]
 3. [suggestion 3]
 
-Original text: {request.text}"""
+Original text: {text}"""
         
-        response = model.generate_content(prompt)
+        key = (text, request.style)
+        response = await single_flight.do(key, lambda: asyncio.to_thread(model.generate_content, prompt))
         result = response.text.strip()
         
         # Parse response
@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import google.generativeai as genai
+import asyncio
 import os
+from single_flight import SingleFlight, normalize_text
 
 app = FastAPI(title="Keywords Service", version="1.0.0")
 
@@ -15,6 +17,8 @@ try:
 except:
     model = genai.GenerativeModel('gemini-pro-latest')
 
+single_flight = SingleFlight()
+
 class KeywordsRequest(BaseModel):
     text: str
     max_keywords: int = 10
@@ -32,18 +36,24 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats():
+    return {"single_flight": single_flight.stats()}
+
 @app.post("/extract", response_model=KeywordsResponse)
 async def extract_keywords(request: KeywordsRequest):
     try:
+        text = normalize_text(request.text)
         prompt = f"""Extract the top {request.max_keywords} most important keywords from this text.
 List them in order of relevance, one per line.
 Only provide the keywords, no explanations.
 
-Text: {request.text}
+Text: {text}
 
 Keywords:"""
         
-        response = model.generate_content(prompt)
+        key = (text, request.max_keywords)
+        response = await single_flight.do(key, lambda: asyncio.to_thread(model.generate_content, prompt))
         keywords_text = response.text.strip()
         
         # Parse keywords
@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import google.generativeai as genai
+import asyncio
 import os
+from single_flight import SingleFlight, normalize_text
 
 app = FastAPI(title="Summary Service", version="1.0.0")
 
@@ -15,6 +17,8 @@ try:
 except:
     model = genai.GenerativeModel('gemini-pro-latest')
 
+single_flight = SingleFlight()
+
 class SummaryRequest(BaseModel):
     text: str
     max_length: int = 100
@@ -33,17 +37,23 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats():
+    return {"single_flight": single_flight.stats()}
+
 @app.post("/summarize", response_model=SummaryResponse)
 async def summarize(request: SummaryRequest):
     try:
+        text = normalize_text(request.text)
         prompt = f"""Summarize the following text in approximately {request.max_length} words.
 Be concise and capture the main ideas.
 
-Text: {request.text}
+Text: {text}
 
 Summary:"""
         
-        response = model.generate_content(prompt)
+        key = (text, request.max_length)
+        response = await single_flight.do(key, lambda: asyncio.to_thread(model.generate_content, prompt))
         summary = response.text.strip()
         
         return {
@@ -0,0 +1,52 @@
+import asyncio
+import importlib.util
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+
+DUPLICATES = 100
+
+
+@pytest.fixture
+def summary(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    spec = importlib.util.spec_from_file_location("summary_main", Path(__file__).with_name("main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_duplicates_share_one_gemini_call(summary, monkeypatch):
+    calls = []
+
+    def stub_generate_content(prompt):
+        calls.append(prompt)
+        time.sleep(0.05)
+        return SimpleNamespace(text="Short summary")
+
+    monkeypatch.setattr(summary.model, "generate_content", stub_generate_content)
+
+    async def post_duplicates():
+        transport = httpx.ASGITransport(app=summary.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://summary") as client:
+            return await asyncio.gather(
+                *[client.post("/summarize", json={"text": "Popular text", "max_length": 50})
+                  for _ in range(DUPLICATES)]
+            )
+
+    responses = asyncio.run(post_duplicates())
+
+    assert len(calls) == 1
+    assert [r.status_code for r in responses] == [200] * DUPLICATES
+    assert {r.json()["summary"] for r in responses} == {"Short summary"}
+    stats = summary.single_flight.stats()
+    assert stats["upstream_calls"] == 1
+    assert stats["coalesced_calls"] == DUPLICATES - 1
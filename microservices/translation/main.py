@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import google.generativeai as genai
+import asyncio
 import os
+from single_flight import SingleFlight, normalize_text
 
 app = FastAPI(title="Translation Service", version="1.0.0")
 
@@ -15,6 +17,8 @@ try:
 except:
     model = genai.GenerativeModel('gemini-pro-latest')
 
+single_flight = SingleFlight()
+
 class TranslationRequest(BaseModel):
     text: str
     target_language: str = "es"
@@ -33,17 +37,23 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats():
+    return {"single_flight": single_flight.stats()}
+
 @app.post("/translate", response_model=TranslationResponse)
 async def translate(request: TranslationRequest):
     try:
+        text = normalize_text(request.text)
         prompt = f"""Translate the following text to {request.target_language}. 
 Only provide the translation, no explanations.
 
-Text: {request.text}
+Text: {text}
 
 Translation:"""
         
-        response = model.generate_content(prompt)
+        key = (text, request.target_language)
+        response = await single_flight.do(key, lambda: asyncio.to_thread(model.generate_content, prompt))
         translated_text = response.text.strip()
         
         return {
@@ -0,0 +1,43 @@
+# Compartido por el gateway y los microservicios; cada Dockerfile lo copia
+# junto a main.py (el contexto de build es la raíz del repo)
+import asyncio
+
+class SingleFlight:
+    # Las peticiones concurrentes con la misma clave comparten una única
+    # llamada upstream (y su resultado o error)
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        # shield: si un cliente se desconecta no cancela la llamada de los demás
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {
+            "inflight": len(self._inflight),
+            "upstream_calls": self.calls,
+            "coalesced_calls": self.coalesced
+        }
+
+def normalize_text(text):
+    # Solo bordes y saltos de línea: los espacios internos (párrafos, listas)
+    # cambian el resultado del modelo. El texto normalizado es el que se envía
+    # upstream, así la clave coincide con la llamada real.
+    return text.replace("\r\n", "\n").strip()
@@ -4,6 +4,7 @@ for service in translation summary analytics improve keywords; do
     # Actualizar main.py para intentar diferentes modelos
     sed -i "s/model = genai.GenerativeModel('gemini-1.5-flash')/try:\n    model = genai.GenerativeModel('gemini-2.5-flash')\nexcept:\n    model = genai.GenerativeModel('gemini-pro-latest')/" main.py
     
-    docker build -t text-processor-$service:v4 .
+    # El contexto de build es la raíz del repo para incluir shared/
+    docker build -t text-processor-$service:v4 -f Dockerfile ../..
     k3d image import text-processor-$service:v4 -c mycluster
 done